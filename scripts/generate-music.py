@@ -3,12 +3,107 @@
 Generate music via Vertex AI Lyria model.
 """
 import argparse
-import base64
-import json
+import fcntl
+import hashlib
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import Path
+import orjson
+import pybase64
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Shared session with keep-alive and retries on transient Vertex errors
+SESSION = requests.Session()
+# Base64 audio has ~6 bits of entropy per byte; brotli compresses it much
+# harder than the default gzip
+SESSION.headers['Accept-Encoding'] = 'br, gzip'
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+
+# Base64 decode chunk size: multiple of 4 chars so every chunk decodes cleanly
+# without mid-stream padding (4 chars -> 3 bytes).
+_B64_CHUNK = 64 * 1024
+
+
+def decode_b64_to_file(b64_string, path):
+    """Decode a base64 string to a file in chunks, keeping peak memory flat."""
+    total = 0
+    with open(path, 'wb') as f:
+        for i in range(0, len(b64_string), _B64_CHUNK):
+            chunk = pybase64.b64decode(b64_string[i:i + _B64_CHUNK], validate=False)
+            f.write(chunk)
+            total += len(chunk)
+    return total
+
+
+def _token_cache_path():
+    cache_root = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return Path(cache_root) / 'gemini-worker' / 'token.json'
+
+
+def _token_cache_key(credentials_path):
+    st = os.stat(credentials_path)
+    return hashlib.sha256(f"{credentials_path}|{st.st_mtime_ns}".encode()).hexdigest()
+
+
+def _fetch_token(credentials_path):
+    """Get a service-account access token, reusing a cached one if still valid.
+
+    Refreshing re-reads the key file, signs a JWT and round-trips to
+    oauth2.googleapis.com (100-500ms); tokens are valid for an hour, so
+    cache them across invocations keyed on the credentials file.
+    """
+    cache_path = _token_cache_path()
+    key = _token_cache_key(credentials_path)
+
+    try:
+        with open(cache_path, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            cached = orjson.loads(f.read())
+        if cached.get('key') == key:
+            expiry = datetime.fromisoformat(cached['expiry'])
+            if datetime.utcnow() + timedelta(seconds=60) < expiry:
+                return cached['token']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    from google.auth.transport.requests import Request
+    from google.oauth2 import service_account
+
+    credentials = service_account.Credentials.from_service_account_file(
+        credentials_path,
+        scopes=['https://www.googleapis.com/auth/cloud-platform']
+    )
+    credentials.refresh(Request())
+
+    # Write-then-rename so concurrent runs never see a partial file
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_bytes(orjson.dumps({
+            'token': credentials.token,
+            'expiry': credentials.expiry.isoformat(),
+            'key': key,
+        }))
+        os.replace(tmp, cache_path)
+    except OSError:
+        pass
+
+    return credentials.token
 
 
 def main():
@@ -28,21 +123,11 @@ def main():
         print("❌ GOOGLE_APPLICATION_CREDENTIALS not set or file not found")
         sys.exit(1)
     
-    # Get access token from service account
-    try:
-        from google.auth.transport.requests import Request
-        from google.oauth2 import service_account
-        
-        credentials = service_account.Credentials.from_service_account_file(
-            credentials_path,
-            scopes=['https://www.googleapis.com/auth/cloud-platform']
-        )
-        credentials.refresh(Request())
-        api_key = credentials.token
-    except Exception as e:
-        print(f"❌ Failed to get access token from service account: {e}")
-        sys.exit(1)
-    
+    # Kick off the OAuth round-trip in the background; it overlaps with the
+    # request build below and is collected right before the POST
+    pool = ThreadPoolExecutor(max_workers=2)
+    token_future = pool.submit(_fetch_token, credentials_path)
+
     location = "us-central1"
     model = "lyria-002"  # Lyria 2 (Vertex AI) - instrumental only
     # Note: Lyria 3 exists but only in Gemini app, not Vertex AI API
@@ -75,42 +160,72 @@ def main():
         }
     }
     
+    # Collect the access token started above
+    try:
+        api_key = token_future.result()
+    except Exception as e:
+        print(f"❌ Failed to get access token from service account: {e}")
+        sys.exit(1)
+    finally:
+        pool.shutdown(wait=False)
+
     # Make API request
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
-    
+
     try:
-        response = requests.post(endpoint, headers=headers, json=request_data)
+        response = SESSION.post(endpoint, headers=headers,
+                                data=orjson.dumps(request_data), stream=True)
         response.raise_for_status()
-        
-        result = response.json()
-        
-        # Check for errors
-        if 'error' in result:
-            print(f"❌ API Error: {result['error'].get('message', result['error'])}")
-            sys.exit(1)
-        
-        # Extract artifacts from Lyria 3 response
-        if 'predictions' not in result or len(result['predictions']) == 0:
-            print("❌ No predictions in response")
-            print(f"Response: {json.dumps(result, indent=2)[:500]}")
-            sys.exit(1)
-        
-        prediction = result['predictions'][0]
-        
-        # 1. Audio (required)
-        audio_content = prediction.get('audioContent')
-        if not audio_content:
-            print("❌ No audioContent in response")
-            print(f"Response: {json.dumps(result, indent=2)[:500]}")
-            sys.exit(1)
-        
-        audio_data = base64.b64decode(audio_content)
-        Path(args.output).write_bytes(audio_data)
-        
-        file_size = len(audio_data)
+
+        if ijson is not None:
+            # Stream-parse the body so the full response (predictions dict
+            # plus tens of MB of base64) is never materialized; only the
+            # audioContent string itself is held before decoding to disk
+            response.raw.decode_content = True
+            file_size = None
+            error_msg = None
+            for prefix, event, value in ijson.parse(response.raw):
+                if prefix == 'predictions.item.audioContent' and event == 'string':
+                    file_size = decode_b64_to_file(value, args.output)
+                    break
+                if prefix == 'error.message' and event == 'string':
+                    error_msg = value
+
+            if error_msg:
+                print(f"❌ API Error: {error_msg}")
+                sys.exit(1)
+            if file_size is None:
+                print("❌ No audioContent in response")
+                sys.exit(1)
+        else:
+            result = orjson.loads(response.content)
+
+            # Check for errors
+            if 'error' in result:
+                print(f"❌ API Error: {result['error'].get('message', result['error'])}")
+                sys.exit(1)
+
+            # Extract artifacts from Lyria 3 response
+            if 'predictions' not in result or len(result['predictions']) == 0:
+                print("❌ No predictions in response")
+                print(f"Response (first 500 bytes): {response.content[:500]!r}")
+                sys.exit(1)
+
+            prediction = result['predictions'][0]
+
+            # 1. Audio (required)
+            audio_content = prediction.get('audioContent')
+            if not audio_content:
+                print("❌ No audioContent in response")
+                print(f"Response (first 500 bytes): {response.content[:500]!r}")
+                sys.exit(1)
+
+            # Decode straight to disk so we never hold the decoded audio in
+            # memory on top of the base64 string
+            file_size = decode_b64_to_file(audio_content, args.output)
         print(f"✅ Music generated successfully!")
         print(f"   🎵 Audio: {args.output} ({file_size / 1024 / 1024:.2f} MB)")
         
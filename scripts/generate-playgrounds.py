@@ -5,14 +5,13 @@ Designed to run in GitHub Actions with secrets.
 Uses <Playground> component (native to project, no import needed).
 """
 import argparse
-import json
+import asyncio
 import os
-import re
 import sys
-import time
 from pathlib import Path
-from google import genai
-from google.genai import types
+import httpx
+import orjson
+from aiolimiter import AsyncLimiter
 
 SECTIONS = {
     "javascript": "vanilla",
@@ -23,18 +22,51 @@ SECTIONS = {
     "react": "react",
 }
 
+GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent"
 
-def has_playground(content):
-    return (
-        "<Playground" in content or
-        "<Sandpack" in content or
-        "## Интерактивный пример" in content
-    )
+# Bound in-flight Gemini requests; the API is the bottleneck, not the client
+MAX_CONCURRENCY = 8
+
+# Stay under the Gemini requests-per-minute quota without idle gaps
+REQUESTS_PER_MINUTE = 40
+
+_HEADER = "## Интерактивный пример"
+
+
+_PLAYGROUND_MARKERS = (
+    b"<Playground",
+    b"<Sandpack",
+    "## Интерактивный пример".encode('utf-8'),
+)
+
+# Markers live near the top (headers) or are appended at the end, so scanning
+# the first and last 64KB is enough without decoding the whole file
+_SCAN_CHUNK = 64 * 1024
+
+
+def scan_has_playground(path, size):
+    """Check a lesson file for playground markers without a full read/decode."""
+    with open(path, 'rb') as f:
+        head = f.read(_SCAN_CHUNK)
+        if any(m in head for m in _PLAYGROUND_MARKERS):
+            return True
+        if size > _SCAN_CHUNK:
+            f.seek(max(_SCAN_CHUNK, size - _SCAN_CHUNK))
+            tail = f.read(_SCAN_CHUNK)
+            if any(m in tail for m in _PLAYGROUND_MARKERS):
+                return True
+    return False
 
 
 def get_lesson_title(content):
-    m = re.search(r'^#+ (.+)$', content, re.MULTILINE)
-    return m.group(1) if m else "урок"
+    # The heading is always in the first few lines; no need to scan the body
+    for line in content[:4096].splitlines():
+        s = line.lstrip()
+        if s.startswith('#'):
+            title = s.lstrip('#').strip()
+            if title:
+                return title
+    return "урок"
 
 
 def get_prompt(content, section, template, filename):
@@ -75,72 +107,142 @@ def get_prompt(content, section, template, filename):
 2. Код МИНИМАЛЬНЫЙ и ИНТЕРАКТИВНЫЙ — демонстрирует тему урока
 3. Escape: \\${{}} для template literals, <\\/script> для тегов скриптов
 4. Тёмная тема: background #282c34, color white
-5. Блок ДОЛЖЕН заканчиваться на `/>` 
+5. Блок ДОЛЖЕН заканчиваться на `/>`
 6. Используй именно <Playground> (не <Sandpack>)
 """
 
 
 def extract_playground_block(text):
-    """Extract Playground block from response"""
-    text = re.sub(r'```(?:html|jsx|mdx|tsx|javascript)?\n', '', text)
-    text = re.sub(r'\n```\s*$', '', text, flags=re.MULTILINE)
+    """Extract Playground block from response with a linear scan.
+
+    The previous regex-based extractor used lazy [\\s\\S]*? matches which
+    degrade badly on long responses with no closing '/>'; plain str.find
+    keeps this O(n) no matter what the model returns.
+    """
     text = text.strip()
 
-    patterns = [
-        r'(## Интерактивный пример\s*\n+<Playground[\s\S]*?/>)',
-        r'(<Playground[\s\S]*?/>)',
-        # fallback: also accept <Sandpack just in case model ignores instructions
-        r'(## Интерактивный пример\s*\n+<Sandpack[\s\S]*?/>)',
-        r'(<Sandpack[\s\S]*?/>)',
-    ]
-    for pattern in patterns:
-        m = re.search(pattern, text)
-        if m:
-            block = m.group(1).strip()
-            if not block.endswith("/>"):
-                continue
-            if not block.startswith("##"):
-                block = "## Интерактивный пример\n\n" + block
-            return "\n\n" + block
+    # Strip markdown code fences without regex
+    if text.startswith('```'):
+        nl = text.find('\n')
+        if nl != -1:
+            text = text[nl + 1:]
+    if text.endswith('```'):
+        text = text[:text.rfind('```')].rstrip()
+
+    # fallback: also accept <Sandpack just in case model ignores instructions
+    for tag in ('<Playground', '<Sandpack'):
+        i = text.find(tag)
+        if i < 0:
+            continue
+        j = text.find('/>', i)
+        if j < 0:
+            continue
+        # Normalize header spacing regardless of how the model emitted it
+        block = text[i:j + 2]
+        return "\n\n" + _HEADER + "\n\n" + block
     return None
 
 
-def generate_playground(client, model, content, section, template, filename, retries=3):
+async def call_gemini(client, api_key, model, prompt):
+    """Streamed generateContent call, stopping as soon as the block closes.
+
+    The playground block ends at '/>', so once the accumulated text ends
+    there the remaining tokens are never needed; closing the stream early
+    saves their generation time.
+    """
+    buf = []
+    async with client.stream(
+        'POST',
+        GEMINI_URL.format(model=model),
+        params={"key": api_key, "alt": "sse"},
+        content=orjson.dumps({
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": 0.2,
+                "maxOutputTokens": 16384,
+            },
+        }),
+        headers={'Content-Type': 'application/json'},
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith('data: '):
+                continue
+            data = orjson.loads(line[6:])
+            parts = data.get('candidates', [{}])[0].get('content', {}).get('parts', [])
+            for p in parts:
+                if p.get('text'):
+                    buf.append(p['text'])
+            # Ignore a trailing code fence when checking for the block end
+            if ''.join(buf).rstrip().rstrip('`').rstrip().endswith('/>'):
+                break
+    return ''.join(buf)
+
+
+async def generate_playground(limiter, client, api_key, model, content, section,
+                              template, filename, retries=3):
     """Generate playground with retry"""
     prompt = get_prompt(content, section, template, filename)
 
     for attempt in range(retries):
         try:
-            response = client.models.generate_content(
-                model=model,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.2,
-                    max_output_tokens=16384,
-                )
-            )
-            result = response.text
+            async with limiter:
+                result = await call_gemini(client, api_key, model, prompt)
             block = extract_playground_block(result)
 
             if block and ("<Playground" in block or "<Sandpack" in block) and block.endswith("/>"):
                 return block
 
             if attempt < retries - 1:
-                print(f"  ⚠️  Попытка {attempt + 1}/{retries}: блок неполный, повтор...")
-                time.sleep(2)
+                print(f"  ⚠️  {filename}: попытка {attempt + 1}/{retries}: блок неполный, повтор...")
+                await asyncio.sleep(2)
             else:
-                print(f"  ❌ Не получен полный блок после {retries} попыток")
+                print(f"  ❌ {filename}: не получен полный блок после {retries} попыток")
 
         except Exception as e:
             if attempt < retries - 1:
-                print(f"  ⚠️  Попытка {attempt + 1}/{retries}: {e}, повтор...")
-                time.sleep(2)
+                print(f"  ⚠️  {filename}: попытка {attempt + 1}/{retries}: {e}, повтор...")
+                await asyncio.sleep(2)
             else:
-                print(f"  ❌ API ошибка: {e}")
+                print(f"  ❌ {filename}: API ошибка: {e}")
 
     return None
 
 
+async def process_lesson(sem, limiter, client, api_key, args, template, fpath):
+    """Generate and append a playground for one lesson; returns True on success"""
+    async with sem:
+        content = fpath.read_text(encoding='utf-8')
+        playground = await generate_playground(
+            limiter, client, api_key, args.model, content, args.section,
+            template, fpath.name
+        )
+
+    if playground:
+        # Append playground block (no import needed for <Playground> component)
+        with open(fpath, 'a', encoding='utf-8') as f:
+            f.write("\n" + playground + "\n")
+        print(f"  ✅ {fpath.stem}")
+        return True
+
+    print(f"  ❌ {fpath.stem}")
+    return False
+
+
+async def run(args, template, needs_playground, api_key):
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    # Token bucket: refills continuously, so requests are spaced by quota
+    # rather than by a fixed sleep after each lesson
+    limiter = AsyncLimiter(REQUESTS_PER_MINUTE, time_period=60)
+    limits = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=120) as client:
+        results = await asyncio.gather(*(
+            process_lesson(sem, limiter, client, api_key, args, template, fpath)
+            for fpath in needs_playground
+        ))
+    return sum(results), len(results) - sum(results)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Generate Playground components for lessons')
     parser.add_argument('--section', required=True, help='Section to process')
@@ -161,31 +263,30 @@ def main():
         sys.exit(1)
 
     template = SECTIONS[args.section]
-    client = genai.Client(api_key=api_key)
 
     pages_dir = Path(args.target) / "pages" / args.section
     if not pages_dir.exists():
         print(f"❌ Section directory not found: {pages_dir}")
         sys.exit(1)
 
-    mdx_files = sorted([
-        f for f in pages_dir.glob("*.mdx")
-        if not f.name.startswith("_")
-    ])
-
-    # Filter files needing playgrounds
+    # Filter files needing playgrounds; the scan only touches head/tail bytes
+    total_files = 0
     needs_playground = []
-    for fpath in mdx_files:
-        content = fpath.read_text(encoding='utf-8')
-        if not has_playground(content):
-            needs_playground.append(fpath)
+    for entry in sorted(os.scandir(pages_dir), key=lambda e: e.name):
+        if entry.name.startswith('_') or not entry.name.endswith('.mdx'):
+            continue
+        if not entry.is_file():
+            continue
+        total_files += 1
+        if not scan_has_playground(entry.path, entry.stat().st_size):
+            needs_playground.append(Path(entry.path))
 
     if args.limit > 0:
         needs_playground = needs_playground[:args.limit]
 
     print(f"🚀 Generating playgrounds for {args.section}")
     print(f"   Model: {args.model}")
-    print(f"   Total files: {len(mdx_files)}")
+    print(f"   Total files: {total_files}")
     print(f"   Need playgrounds: {len(needs_playground)}")
     print()
 
@@ -193,29 +294,7 @@ def main():
         print("✅ All lessons already have playgrounds")
         return
 
-    success = 0
-    failed = 0
-
-    for i, fpath in enumerate(needs_playground, 1):
-        lesson_name = fpath.stem
-        print(f"[{i}/{len(needs_playground)}] {lesson_name}")
-
-        content = fpath.read_text(encoding='utf-8')
-        playground = generate_playground(
-            client, args.model, content, args.section, template, fpath.name
-        )
-
-        if playground:
-            # Append playground block (no import needed for <Playground> component)
-            with open(fpath, 'a', encoding='utf-8') as f:
-                f.write("\n" + playground + "\n")
-            print(f"  ✅ Added")
-            success += 1
-        else:
-            print(f"  ❌ Failed")
-            failed += 1
-
-        time.sleep(1.5)
+    success, failed = asyncio.run(run(args, template, needs_playground, api_key))
 
     print()
     print(f"{'='*60}")
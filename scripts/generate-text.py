@@ -34,7 +34,7 @@ def main():
     print(f"   Temperature: {args.temperature}")
     
     try:
-        response = client.models.generate_content(
+        stream = client.models.generate_content_stream(
             model=args.model,
             contents=args.prompt,
             config=types.GenerateContentConfig(
@@ -42,14 +42,28 @@ def main():
                 max_output_tokens=args.max_tokens,
             )
         )
-        
-        result_text = response.text
-        
-        Path(args.output).write_text(result_text, encoding='utf-8')
-        
+
+        # Write chunks as they arrive instead of waiting for the full
+        # response; counts are kept incrementally
+        chars = 0
+        words = 0
+        prev_tail_in_word = False
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for chunk in stream:
+                text = chunk.text
+                if not text:
+                    continue
+                f.write(text)
+                chars += len(text)
+                words += len(text.split())
+                # A word split across two chunks would be counted twice
+                if prev_tail_in_word and not text[0].isspace():
+                    words -= 1
+                prev_tail_in_word = not text[-1].isspace()
+
         print(f"✅ Text saved to: {args.output}")
-        print(f"   Characters: {len(result_text)}")
-        print(f"   Words: {len(result_text.split())}")
+        print(f"   Characters: {chars}")
+        print(f"   Words: {words}")
         
     except Exception as e:
         print(f"❌ Error: {e}")
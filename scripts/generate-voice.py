@@ -3,135 +3,216 @@
 Generate voice via Gemini TTS (Text-to-Speech).
 """
 import argparse
-import base64
+import asyncio
+import binascii
 import json
 import os
-import subprocess
+import re
 import sys
-import tempfile
+import wave
 from pathlib import Path
-from google import genai
+import httpx
 
+# Module-level client so repeated calls (imports, batch harnesses) reuse the
+# TLS session instead of handshaking per request; HTTP/2 multiplexes batch
+# clips over one connection
+_SESSION = httpx.AsyncClient(
+    http2=True,
+    timeout=60,
+    limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=60),
+)
 
-def main():
-    parser = argparse.ArgumentParser(description='Generate voice via Gemini TTS')
-    parser.add_argument('--text', required=True, help='Text to synthesize')
-    parser.add_argument('--voice', default='Fenrir', help='Voice name (Fenrir, Kore, Charon, Aoede)')
-    parser.add_argument('--model', default='gemini-2.5-flash-preview-tts', help='TTS model')
-    parser.add_argument('--output', default='output.wav', help='Output WAV file')
-    
-    args = parser.parse_args()
-    
-    api_key = os.environ.get("GOOGLE_GEMINI_API_KEY")
-    if not api_key:
-        print("❌ GOOGLE_GEMINI_API_KEY not set")
-        sys.exit(1)
-    
-    print(f"🎙️ Generating speech with Gemini TTS...")
-    print(f"   Model: {args.model}")
-    print(f"   Voice: {args.voice}")
-    print(f"   Text: {args.text[:100]}{'...' if len(args.text) > 100 else ''}")
-    
-    # Prepare request
+# Sample rate embedded in the response MIME type, e.g. "audio/L16;rate=24000"
+_RATE_RE = re.compile(r'rate=(\d+)')
+
+# Base64 decode chunk size — multiple of 4 chars so every chunk decodes
+# without padding errors
+_B64_CHUNK = 64 * 1024
+
+# Bound concurrent TTS requests in batch mode to respect rate limits
+MAX_CONCURRENCY = 8
+
+
+def decode_b64(b64_string):
+    """Decode base64 in chunks so peak memory stays near the decoded size.
+
+    The output size is known up front (3 bytes per 4 chars), so the buffer
+    is preallocated once instead of growing geometrically under +=.
+    """
+    buf = bytearray((len(b64_string) * 3) // 4)
+    mv = memoryview(buf)
+    off = 0
+    for i in range(0, len(b64_string), _B64_CHUNK):
+        block = binascii.a2b_base64(b64_string[i:i + _B64_CHUNK])
+        mv[off:off + len(block)] = block
+        off += len(block)
+    mv.release()
+    # Padding ('=') makes the estimate up to 2 bytes high
+    if off < len(buf):
+        del buf[off:]
+    return buf
+
+
+async def synth_one(text, out_path, model, voice, api_key, quiet=False):
+    """Synthesize one clip to out_path; returns True on success.
+
+    Status lines are buffered and flushed in a single write so concurrent
+    batch clips don't interleave output (and quiet mode skips them
+    entirely); errors always print.
+    """
+    msgs = []
     request_data = {
         "contents": [{
-            "parts": [{"text": args.text}]
+            "parts": [{"text": text}]
         }],
         "generationConfig": {
             "responseModalities": ["AUDIO"],
             "speechConfig": {
                 "voiceConfig": {
                     "prebuiltVoiceConfig": {
-                        "voiceName": args.voice
+                        "voiceName": voice
                     }
                 }
             }
         }
     }
-    
-    # Call API via curl (google-genai SDK doesn't support TTS yet)
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{args.model}:generateContent?key={api_key}"
-    
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as req_file:
-        json.dump(request_data, req_file)
-        req_path = req_file.name
-    
+
+    # Call the REST API directly (google-genai SDK doesn't support TTS yet)
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
+
     try:
         # Make request
-        result = subprocess.run(
-            ['curl', '-s', '-X', 'POST', url, 
-             '-H', 'Content-Type: application/json',
-             '-d', f'@{req_path}'],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        response = json.loads(result.stdout)
-        
-        # Extract audio data
-        if 'candidates' in response and len(response['candidates']) > 0:
+        resp = await _SESSION.post(url, json=request_data)
+        resp.raise_for_status()
+        response = resp.json()
+
+        # Extract the first audio part; a generator with next() stops at the
+        # first hit and keeps the happy path flat
+        parts = []
+        if response.get('candidates'):
             parts = response['candidates'][0].get('content', {}).get('parts', [])
-            for part in parts:
-                if 'inlineData' in part:
-                    mime_type = part['inlineData'].get('mimeType', 'audio/L16')
-                    audio_b64 = part['inlineData']['data']
-                    
-                    # Extract sample rate from MIME type
-                    sample_rate = 24000  # default
-                    if 'rate=' in mime_type:
-                        try:
-                            sample_rate = int(mime_type.split('rate=')[1].split(';')[0])
-                        except:
-                            pass
-                    
-                    print(f"   📦 MIME type: {mime_type}")
-                    print(f"   🎵 Sample rate: {sample_rate}Hz")
-                    
-                    # Decode audio
-                    audio_data = base64.b64decode(audio_b64)
-                    
-                    # Save as PCM temporarily
-                    with tempfile.NamedTemporaryFile(suffix='.pcm', delete=False) as pcm_file:
-                        pcm_file.write(audio_data)
-                        pcm_path = pcm_file.name
-                    
-                    print(f"   💾 Raw PCM size: {len(audio_data)} bytes")
-                    
-                    # Convert PCM to WAV using ffmpeg
-                    subprocess.run(
-                        ['ffmpeg', '-f', 's16le', '-ar', str(sample_rate), '-ac', '1',
-                         '-i', pcm_path, '-y', args.output],
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                        check=True
-                    )
-                    
-                    os.unlink(pcm_path)
-                    
-                    wav_size = Path(args.output).stat().st_size
-                    print(f"✅ Voice saved to: {args.output}")
-                    print(f"   🔊 File size: {wav_size} bytes ({wav_size / 1024:.1f} KB)")
-                    return
-        
+        part = next((p for p in parts if 'inlineData' in p), None)
+
+        if part is not None:
+            inline = part['inlineData']
+            mime_type = inline.get('mimeType', 'audio/L16')
+            audio_b64 = inline['data']
+
+            # Extract sample rate from MIME type
+            m = _RATE_RE.search(mime_type)
+            sample_rate = int(m.group(1)) if m else 24000
+
+            msgs.append(f"   📦 MIME type: {mime_type}")
+            msgs.append(f"   🎵 Sample rate: {sample_rate}Hz")
+
+            # Decode audio
+            audio_data = decode_b64(audio_b64)
+
+            msgs.append(f"   💾 Raw PCM size: {len(audio_data)} bytes")
+
+            # Wrap the raw s16le PCM in a WAV header ourselves — spawning
+            # ffmpeg for a 44-byte RIFF header is overkill
+            with wave.open(str(out_path), 'wb') as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(sample_rate)
+                # writeframesraw skips an intermediate copy; close() patches
+                # the header sizes
+                w.writeframesraw(memoryview(audio_data))
+
+            # Drop the PCM buffer before the remaining prints so tens of MB
+            # aren't retained per clip in batch mode
+            del audio_data
+
+            wav_size = Path(out_path).stat().st_size
+            msgs.append(f"✅ Voice saved to: {out_path}")
+            msgs.append(f"   🔊 File size: {wav_size} bytes ({wav_size / 1024:.1f} KB)")
+            if not quiet:
+                sys.stdout.write("\n".join(msgs) + "\n")
+                sys.stdout.flush()
+            return True
+
         # If no audio found, check for error
         if 'error' in response:
             print(f"❌ API Error: {response['error']}")
         else:
             print(f"❌ No audio in response")
             print(f"Response: {json.dumps(response, indent=2)[:500]}")
-        sys.exit(1)
-        
-    except subprocess.CalledProcessError as e:
+        return False
+
+    except httpx.HTTPError as e:
         print(f"❌ Request failed: {e}")
-        sys.exit(1)
+        return False
     except Exception as e:
         print(f"❌ Error: {e}")
+        return False
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Generate voice via Gemini TTS')
+    text_group = parser.add_mutually_exclusive_group(required=True)
+    text_group.add_argument('--text', help='Text to synthesize')
+    text_group.add_argument('--text-file', help='File with one text per line (batch mode)')
+    parser.add_argument('--voice', default='Fenrir', help='Voice name (Fenrir, Kore, Charon, Aoede)')
+    parser.add_argument('--model', default='gemini-2.5-flash-preview-tts', help='TTS model')
+    parser.add_argument('--output', default='output.wav', help='Output WAV file')
+    parser.add_argument('--output-dir', default='voice_out', help='Output directory for batch mode')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print errors and the final summary')
+
+    args = parser.parse_args()
+
+    api_key = os.environ.get("GOOGLE_GEMINI_API_KEY")
+    if not api_key:
+        print("❌ GOOGLE_GEMINI_API_KEY not set")
         sys.exit(1)
-    finally:
-        if os.path.exists(req_path):
-            os.unlink(req_path)
+
+    if not args.quiet:
+        sys.stdout.write(
+            f"🎙️ Generating speech with Gemini TTS...\n"
+            f"   Model: {args.model}\n"
+            f"   Voice: {args.voice}\n"
+        )
+
+    if args.text_file:
+        lines = [
+            line.strip()
+            for line in Path(args.text_file).read_text(encoding='utf-8').splitlines()
+            if line.strip()
+        ]
+        if not lines:
+            print(f"❌ No text lines in {args.text_file}")
+            sys.exit(1)
+
+        out_dir = Path(args.output_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        if not args.quiet:
+            print(f"   Clips: {len(lines)} → {out_dir}/")
+
+        # Fan out the clips; the bottleneck is server latency, so concurrent
+        # requests give near-linear speedup up to the rate limit
+        sem = asyncio.Semaphore(MAX_CONCURRENCY)
+
+        async def bounded(text, out_path):
+            async with sem:
+                return await synth_one(text, out_path, args.model, args.voice,
+                                       api_key, quiet=args.quiet)
+
+        results = await asyncio.gather(*(
+            bounded(line, out_dir / f"{i:04}.wav")
+            for i, line in enumerate(lines)
+        ))
+
+        failed = len(results) - sum(results)
+        print(f"✅ Generated {sum(results)}/{len(results)} clips")
+        if failed:
+            sys.exit(1)
+    else:
+        if not args.quiet:
+            print(f"   Text: {args.text[:100]}{'...' if len(args.text) > 100 else ''}")
+        if not await synth_one(args.text, args.output, args.model, args.voice,
+                               api_key, quiet=args.quiet):
+            sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
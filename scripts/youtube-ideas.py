@@ -3,48 +3,23 @@
 Generate YouTube video ideas via Gemini.
 """
 import argparse
-import json
+import asyncio
+import functools
+import hashlib
 import os
 import sys
+import time
 from pathlib import Path
+import fastjsonschema
+import orjson
 from google import genai
 from google.genai import types
 
+TEMPERATURE = 0.9  # Креативность
 
-def decode_unicode_in_object(obj):
-    """Recursively decode Unicode escape sequences in object."""
-    if isinstance(obj, dict):
-        return {k: decode_unicode_in_object(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [decode_unicode_in_object(item) for item in obj]
-    elif isinstance(obj, str):
-        # Decode \uXXXX sequences
-        try:
-            return obj.encode('utf-8').decode('unicode-escape')
-        except:
-            return obj
-    return obj
-
-
-def main():
-    parser = argparse.ArgumentParser(description='Generate YouTube ideas')
-    parser.add_argument('--count', type=int, default=10, help='Number of ideas')
-    parser.add_argument('--topic', help='Topic/theme (optional)')
-    parser.add_argument('--model', default='gemini-3.1-pro-preview', help='Model name')
-    parser.add_argument('--output', default='youtube_ideas.json', help='Output file')
-    
-    args = parser.parse_args()
-    
-    api_key = os.environ.get("GOOGLE_GEMINI_API_KEY")
-    if not api_key:
-        print("❌ GOOGLE_GEMINI_API_KEY not set")
-        sys.exit(1)
-    
-    client = genai.Client(api_key=api_key)
-    
-    topic_part = f" на тему '{args.topic}'" if args.topic else ""
-    
-    prompt = f"""Создай {args.count} идей для YouTube видео{topic_part}.
+# Built once at import; .format fills in count/topic per run instead of
+# re-evaluating a ~1KB f-string inside main()
+_PROMPT_TEMPLATE = """Создай {count} идей для YouTube видео{topic_part}.
 
 Канал: @sov-it (технологии, программирование, AI, инструменты для разработчиков).
 Аудитория: разработчики, tech-энтузиасты, русскоязычные.
@@ -73,55 +48,163 @@ def main():
 
 Верни ТОЛЬКО валидный JSON, без дополнительного текста."""
 
-    print(f"💡 Generating {args.count} YouTube ideas...")
-    print(f"   Model: {args.model}")
-    if args.topic:
-        print(f"   Topic: {args.topic}")
+# Compiled once at import; catches a malformed model response before it is
+# written to disk as a useless ideas file
+_VALIDATE_IDEAS = fastjsonschema.compile({
+    "type": "object",
+    "required": ["ideas"],
+    "properties": {
+        "ideas": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["title", "description"],
+            },
+        },
+    },
+})
+
+
+@functools.lru_cache(maxsize=1)
+def _get_client(api_key):
+    """Lazy singleton so repeated main() calls reuse the connection pool."""
+    # HTTP/2 keeps one multiplexed TLS session to the Gemini endpoint
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            client_args={'http2': True},
+            async_client_args={'http2': True},
+        ),
+    )
+
+
+def _cache_dir():
+    cache_root = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return Path(cache_root) / 'gemini-worker' / 'ideas'
+
+
+def read_cached_response(cache_file, ttl):
+    """Return the cached response text if it exists and is fresh enough."""
+    try:
+        if time.time() - cache_file.stat().st_mtime < ttl:
+            return cache_file.read_text(encoding='utf-8')
+    except OSError:
+        pass
+    return None
+
+
+def write_cached_response(cache_file, text):
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_text(text, encoding='utf-8')
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Generate YouTube ideas')
+    parser.add_argument('--count', type=int, default=10, help='Number of ideas')
+    parser.add_argument('--topic', help='Topic/theme (optional)')
+    parser.add_argument('--model', default='gemini-3.1-pro-preview', help='Model name')
+    parser.add_argument('--output', default='youtube_ideas.json', help='Output file')
+    parser.add_argument('--no-cache', action='store_true', help='Skip the response cache')
+    parser.add_argument('--cache-ttl', type=int, default=86400,
+                        help='Response cache lifetime in seconds (default: 1 day)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Only print errors')
+    
+    args = parser.parse_args()
+    
+    api_key = os.environ.get("GOOGLE_GEMINI_API_KEY")
+    if not api_key:
+        print("❌ GOOGLE_GEMINI_API_KEY not set")
+        sys.exit(1)
+    
+    client = _get_client(api_key)
     
+    topic_part = f" на тему '{args.topic}'" if args.topic else ""
+
+    prompt = _PROMPT_TEMPLATE.format(count=args.count, topic_part=topic_part)
+
+    if not args.quiet:
+        sys.stdout.write(
+            f"💡 Generating {args.count} YouTube ideas...\n"
+            f"   Model: {args.model}\n"
+            + (f"   Topic: {args.topic}\n" if args.topic else "")
+        )
+    
+    # Identical (model, prompt, temperature) calls return the cached response
+    # instead of re-spending tokens and latency
+    cache_key = hashlib.blake2b(
+        f"{args.model}|{prompt}|{TEMPERATURE}".encode()
+    ).hexdigest()
+    cache_file = _cache_dir() / f"{cache_key}.json"
+
     try:
-        response = client.models.generate_content(
-            model=args.model,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.9,  # Креативность
-                max_output_tokens=8192,
+        result_text = None
+        if not args.no_cache:
+            result_text = read_cached_response(cache_file, args.cache_ttl)
+            if result_text is not None and not args.quiet:
+                print(f"   ♻️  Using cached response")
+
+        if result_text is None:
+            response = await client.aio.models.generate_content(
+                model=args.model,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    temperature=TEMPERATURE,
+                    max_output_tokens=8192,
+                )
             )
-        )
-        
-        result_text = response.text
-        
-        # Remove markdown code fences if present
+            result_text = response.text
+            if not args.no_cache:
+                write_cached_response(cache_file, result_text)
+
+        # Remove markdown code fences if present; trim in place rather than
+        # splitting the whole response into a list of lines
         result_text = result_text.strip()
         if result_text.startswith('```'):
-            result_text = '\n'.join(result_text.split('\n')[1:-1])
+            nl = result_text.find('\n')
+            if nl != -1:
+                result_text = result_text[nl + 1:]
+            if result_text.endswith('```'):
+                result_text = result_text[:result_text.rindex('```')].rstrip()
         
         # Parse JSON
         try:
-            ideas_json = json.loads(result_text)
-            
-            # Decode Unicode escapes
-            ideas_json = decode_unicode_in_object(ideas_json)
-            
-            # Save
-            Path(args.output).write_text(
-                json.dumps(ideas_json, ensure_ascii=False, indent=2),
-                encoding='utf-8'
-            )
-            
-            print(f"✅ Saved {len(ideas_json.get('ideas', []))} ideas to: {args.output}")
-            
-            # Preview
-            for i, idea in enumerate(ideas_json.get('ideas', [])[:3], 1):
-                print(f"\n{i}. {idea.get('title', 'N/A')}")
-                print(f"   {idea.get('description', 'N/A')}")
+            # orjson decodes \uXXXX escapes natively and always emits UTF-8
+            ideas_json = orjson.loads(result_text)
+            _VALIDATE_IDEAS(ideas_json)
+
+            # Save atomically so an interrupted run never leaves a truncated
+            # ideas file behind
+            out_path = Path(args.output)
+            tmp = out_path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp.write_bytes(orjson.dumps(ideas_json, option=orjson.OPT_INDENT_2))
+            os.replace(tmp, out_path)
             
-            if len(ideas_json.get('ideas', [])) > 3:
-                print(f"\n... и ещё {len(ideas_json['ideas']) - 3}")
+            if not args.quiet:
+                # Batch the summary and preview into one write so concurrent
+                # invocations don't interleave their output
+                ideas = ideas_json.get('ideas', [])
+                msgs = [f"✅ Saved {len(ideas)} ideas to: {args.output}"]
+                for i, idea in enumerate(ideas[:3], 1):
+                    msgs.append(f"\n{i}. {idea.get('title', 'N/A')}")
+                    msgs.append(f"   {idea.get('description', 'N/A')}")
+                if len(ideas) > 3:
+                    msgs.append(f"\n... и ещё {len(ideas) - 3}")
+                sys.stdout.write("\n".join(msgs) + "\n")
                 
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"❌ Failed to parse JSON: {e}")
             print(f"Response:\n{result_text[:500]}")
             sys.exit(1)
+        except fastjsonschema.JsonSchemaException as e:
+            print(f"❌ Response JSON has unexpected shape: {e}")
+            print(f"Response:\n{result_text[:500]}")
+            sys.exit(1)
         
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -129,4 +212,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())